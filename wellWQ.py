@@ -1,8 +1,14 @@
+import hashlib
+import io
+import os
+import tempfile
+import uuid
 import streamlit as st
-import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import is_numeric_dtype
+from python_calamine import CalamineError
 
 # -----------------
 # Page Configuration
@@ -30,34 +36,490 @@ st.markdown("<h4 style='text-align: center; font-style: italic; color: #0059b3;'
 st.markdown("<h5 style='text-align: center; color: #003366;'>- Thomas Fuller</h5>", unsafe_allow_html=True)
 st.image(
     "https://images.unsplash.com/photo-1506744038136-46273834b3fb?ixlib=rb-4.0.3&auto=format&fit=crop&w=1500&q=80",
-    use_container_width=True
+    width="stretch"
 )
 
 # -----------------
-# Load default data
+# Shared dtype preparation
 # -----------------
-@st.cache_data
-def load_default_data():
-    df = pd.read_csv("WQ_Basin.csv")
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+MAX_CATEGORIES = 100
+# columns nothing downstream reads; skipped at parse time
+DROP_COLS = {'OBJECTID_12'}
+
+def downcast_floats(df):
+    for c in df.select_dtypes('float64').columns:
+        df[c] = pd.to_numeric(df[c], downcast='float')
+    return df
+
+def prepare_data(df):
+    # fixed ISO format (as documented in Help) skips per-element inference;
+    # cache=True parses each distinct date string only once. Uploads in
+    # another layout (dd-mm-yyyy, yyyy/mm/dd, ...) leave most dates NaT
+    # under it and are re-parsed with format inference instead. Inference
+    # guesses the layout from the first value, month first unless told
+    # otherwise, so both orders are tried and the one reading more dates kept.
+    dates = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce', cache=True)
+    unparsed = dates.isna().sum() - df['Date'].isna().sum()
+    if unparsed > dates.notna().sum():
+        month_first = pd.to_datetime(df['Date'], errors='coerce', cache=True)
+        day_first = pd.to_datetime(df['Date'], errors='coerce', cache=True, dayfirst=True)
+        dates = day_first if day_first.notna().sum() > month_first.notna().sum() else month_first
+    df['Date'] = dates
     df['Year'] = df['Date'].dt.year
+    # float32 halves the bytes every filter/groupby touches; categorical
+    # Basin/Season turn string compares and group keys into integer codes,
+    # and high-cardinality uploads fall back to Arrow strings, whose
+    # equality compare is still a vectorised kernel
+    df = downcast_floats(df)
+    for c in ['Basin', 'Season']:
+        df[c] = df[c].astype('category' if df[c].nunique() < MAX_CATEGORIES else 'string[pyarrow]')
+    # rows without a parseable Date never fall inside a year range; how many
+    # were dropped rides along in attrs (kept in the Parquet copy too)
+    n_rows = len(df)
+    df = df.dropna(subset=['Year']).astype({'Year': 'int16'})
+    # sorted by (Basin, Year): each basin's rows form one contiguous block
+    # with its years in ascending order
+    df = df.sort_values(['Basin','Year'], kind='mergesort', ignore_index=True)
+    df.attrs['dropped_rows'] = n_rows - len(df)
     return df
 
-df_default = load_default_data()
-df = df_default.copy()
+# -----------------
+# Selection options (basins, year bounds, parameters)
+# -----------------
+EXCLUDE_COLS = ['OBJECTID_12', 'Latitude', 'Longitude', 'Year']
+
+def build_schema(df):
+    # derived once per load inside the cached loaders and returned with the
+    # frame, so reruns never re-scan dtypes or re-filter the parameter list
+    parameters = df.select_dtypes(include=[np.number]).columns
+    return {
+        "basins": tuple(df['Basin'].dropna().unique()),
+        "year_min": int(df['Year'].min()),
+        "year_max": int(df['Year'].max()),
+        "parameters": tuple(p for p in parameters if p not in EXCLUDE_COLS),
+        "dropped_rows": df.attrs.get('dropped_rows', 0),
+    }
+
+# -----------------
+# Parquet copies of prepared data
+# -----------------
+PARQUET_ERRORS = (OSError, ValueError, pa.ArrowException)
+
+def read_parquet_copy(path):
+    # an unreadable or truncated copy just means "parse the source again"
+    try:
+        return pd.read_parquet(path, engine="pyarrow")
+    except PARQUET_ERRORS:
+        return None
+
+def write_parquet_copy(df, path, **kwargs):
+    # best effort: written to a uniquely named temp file beside the target
+    # and renamed into place, so a failed or interrupted write never leaves
+    # a partial copy that later loads would pick up. Not mkstemp: its 0600
+    # mode would carry over through os.replace.
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(tmp, engine="pyarrow", index=False, **kwargs)
+        os.replace(tmp, path)
+    except PARQUET_ERRORS:
+        pass
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# -----------------
+# Load default data
+# -----------------
+DEFAULT_CSV = "WQ_Basin.csv"
+DEFAULT_PARQUET = "WQ_Basin.parquet"
+
+# The loaders use cache_resource: every rerun gets the same DataFrame object
+# (and its schema) back instead of unpickling a fresh multi-MB copy, so the
+# returned frame is shared across sessions and must be treated as read-only.
+@st.cache_resource
+def load_default_data():
+    # rebuilt whenever the CSV or this script (and so prepare_data) changes
+    source_mtime = max(os.path.getmtime(DEFAULT_CSV), os.path.getmtime(__file__))
+    df = None
+    if os.path.exists(DEFAULT_PARQUET) and os.path.getmtime(DEFAULT_PARQUET) >= source_mtime:
+        df = read_parquet_copy(DEFAULT_PARQUET)
+    if df is None:
+        # one-time conversion: the Parquet copy keeps the prepared dtypes
+        # (float32, categories, int16 Year) and the (Basin, Year) row order
+        # so later cold starts skip CSV parsing
+        df = prepare_data(pd.read_csv(DEFAULT_CSV, usecols=lambda c: c not in DROP_COLS))
+        write_parquet_copy(df, DEFAULT_PARQUET)
+    df.attrs['source'] = DEFAULT_CSV
+    return df, build_schema(df)
+
+df, schema = load_default_data()
 
 # -----------------
 # Load user uploaded data
 # -----------------
-@st.cache_data
+# full container signatures, so a CSV whose header merely starts with "PK"
+# still goes to the CSV reader
+EXCEL_MAGIC = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')  # .xlsx (zip), .xls (OLE2)
+# what the parsers raise on a malformed upload; shown to the user
+UPLOAD_ERRORS = (ValueError, CalamineError, pa.ArrowException)
+UPLOAD_CACHE_DIR = tempfile.gettempdir()
+# CSVs above this size are parsed in row chunks
+LARGE_UPLOAD_BYTES = 100 * 1024**2
+CSV_CHUNK_ROWS = 50_000
+
+def as_text(col):
+    return col.astype(str).where(col.notna())
+
+# uploads are pinned in memory across sessions, so only the latest few are
+# kept and an idle one is released after an hour; the Parquet copy makes a
+# reload after eviction cheap
+@st.cache_resource(max_entries=2, ttl=3600)
 def load_data(file):
-    if file.name.endswith('.csv'):
-        df = pd.read_csv(file)
+    # prepared uploads are kept as Parquet keyed by content hash, so the same
+    # file uploaded again (even after a server restart) skips parsing
+    digest = hashlib.md5(file.getbuffer()).hexdigest()
+    cached = os.path.join(UPLOAD_CACHE_DIR, f"wellwq_{digest}.parquet")
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(__file__):
+        df = read_parquet_copy(cached)
+        if df is not None:
+            df.attrs['source'] = digest
+            return df, build_schema(df)
+
+    # dispatch on the leading bytes, not the file name, so a renamed or
+    # mis-suffixed upload still goes to the right parser
+    file.seek(0)
+    head = file.read(8)
+    file.seek(0)
+    if head.startswith(EXCEL_MAGIC):
+        df = pd.read_excel(file, engine="calamine", usecols=lambda c: c not in DROP_COLS)
     else:
-        df = pd.read_excel(file)
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df['Year'] = df['Date'].dt.year
-    return df
+        # the pyarrow engine only takes a column list, so read the header first
+        header = pd.read_csv(file, nrows=0).columns
+        usecols = [c for c in header if c not in DROP_COLS]
+        file.seek(0)
+        if file.getbuffer().nbytes > LARGE_UPLOAD_BYTES:
+            # each chunk is downcast to float32 before the concat, so peak
+            # memory never holds the whole float64 frame (or a full Arrow
+            # table) next to its converted copy
+            reader = pd.read_csv(file, usecols=usecols, chunksize=CSV_CHUNK_ROWS, low_memory=False)
+            chunks = [downcast_floats(c) for c in reader]
+            # dtypes are inferred per chunk: a column read as text in any
+            # chunk (well IDs 43003 vs 43042A) is made text in all of them,
+            # so the concat never yields a mixed int/str object column
+            text = {c for c in usecols if not all(is_numeric_dtype(chunk[c]) for chunk in chunks)}
+            df = pd.concat([chunk.assign(**{c: as_text(chunk[c]) for c in text}) for chunk in chunks], ignore_index=True)
+        else:
+            df = pd.read_csv(file, engine="pyarrow", usecols=usecols)
+    df = prepare_data(df)
+    if df.empty:
+        raise ValueError("No rows with a readable Date were found in the uploaded file.")
+    # columns Arrow cannot store (e.g. Excel well numbers mixing 43003 and
+    # 43042A) only cost the cached copy, never the upload itself
+    write_parquet_copy(df, cached, compression='snappy')
+    df.attrs['source'] = digest
+    return df, build_schema(df)
+
+# -----------------
+# Cached per-selection computations
+# -----------------
+# Loaded frames are shared, never-mutated cache_resource objects, so helpers
+# that take a whole dataset key it by the loader's source tag (the default
+# CSV or the upload's content hash) instead of re-hashing every row on each
+# rerun. Unlike id(), the tag cannot be reused by a different frame once an
+# evicted upload is garbage collected.
+FRAME_HASH = {pd.DataFrame: lambda df: df.attrs['source']}
+
+@st.cache_resource(show_spinner=False, hash_funcs=FRAME_HASH, max_entries=3)
+def build_basin_store(df):
+    # basin -> (row positions, {column: array}), built once per dataset: a
+    # struct of arrays holding the sorted years, integer season codes and one
+    # contiguous float32 vector per parameter, so the kernels below read only
+    # the vectors they need instead of slicing the mixed-dtype frame
+    codes, seasons = pd.factorize(df['Season'], sort=True)
+    columns = {
+        'Year': df['Year'].to_numpy(),
+        'Season': codes.astype(np.int8 if len(seasons) < 128 else np.int32),
+    }
+    for p in df.select_dtypes(include=[np.number]).columns:
+        if p not in EXCLUDE_COLS:
+            columns[p] = df[p].to_numpy(dtype=np.float32)
+    store = {
+        basin: (rows, {name: col[rows] for name, col in columns.items()})
+        for basin, rows in df.groupby('Basin', observed=True).indices.items()
+    }
+    return seasons, store
+
+def basin_arrays(df, basin):
+    _, store = build_basin_store(df)
+    if basin in store:
+        return store[basin]
+    rows, columns = next(iter(store.values()))
+    return rows[:0], {name: col[:0] for name, col in columns.items()}
+
+def season_labels(df):
+    return build_basin_store(df)[0]
+
+def year_bounds(years, y0, y1):
+    # each basin's years are sorted, so a range is two binary searches
+    return np.searchsorted(years, y0, side='left'), np.searchsorted(years, y1, side='right')
+
+def year_slice(df, basin, y0, y1):
+    # row positions of the basin within [y0, y1]: a view of the rows array,
+    # no frame is built
+    rows, columns = basin_arrays(df, basin)
+    lo, hi = year_bounds(columns['Year'], y0, y1)
+    return rows[lo:hi]
+
+STATS = ["mean","median","min","max","std","count"]
+
+def group_stats(years, season_codes, seasons, values, stats):
+    # encode (Year, Season) as a dense int key and reduce with np.bincount:
+    # count, mean and std are single C loops over the values with no sort
+    # and no pandas per-group dispatch
+    keep = season_codes >= 0
+    year_dtype = years.dtype
+    years = years[keep].astype(np.int64)
+    values = values[keep].astype(np.float64)
+    if years.size == 0:
+        return pd.DataFrame(columns=['Year','Season', *stats])
+    year_min, n_seasons = years.min(), len(seasons)
+    keys = (years - year_min) * n_seasons + season_codes[keep]
+    n_keys = int(keys.max()) + 1
+    present = np.flatnonzero(np.bincount(keys, minlength=n_keys))
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    count = np.bincount(keys, weights=valid, minlength=n_keys)
+    columns = {'count': count[present].astype(np.int64)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if 'mean' in stats or 'std' in stats:
+            mean = np.bincount(keys, weights=filled, minlength=n_keys) / count
+            columns['mean'] = mean[present]
+        if 'std' in stats:
+            dev = np.where(valid, values - mean[keys], 0.0)
+            var = np.bincount(keys, weights=dev * dev, minlength=n_keys) / (count - 1)
+            columns['std'] = np.where(count > 1, np.sqrt(var), np.nan)[present]
+
+    # one lexsort by (key, value) leaves every group's values ascending with
+    # NaNs last, so min, max and median are gathers at offsets derived from
+    # the group starts and counts: no per-group Python loop
+    if {'min', 'max', 'median'} & set(stats):
+        order = np.lexsort((values, keys))
+        sorted_values = values[order]
+        starts = np.searchsorted(keys[order], present)
+        n = columns['count']
+        last = np.maximum(n - 1, 0)
+        empty = n == 0
+        if 'min' in stats:
+            columns['min'] = np.where(empty, np.nan, sorted_values[starts])
+        if 'max' in stats:
+            columns['max'] = np.where(empty, np.nan, sorted_values[starts + last])
+        if 'median' in stats:
+            mid = sorted_values[starts + last // 2] + sorted_values[starts + n // 2]
+            columns['median'] = np.where(empty, np.nan, mid / 2)
+
+    results = pd.DataFrame({
+        'Year': (present // n_seasons + year_min).astype(year_dtype),
+        'Season': seasons.take(present % n_seasons),
+    })
+    for name in stats:
+        results[name] = columns[name]
+    return results
+
+@st.cache_data(show_spinner=False, hash_funcs=FRAME_HASH)
+def agg_cube(df, basin, param):
+    # every statistic for every (Year, Season) of the basin, computed once per
+    # (basin, parameter); year-range and statistic changes only slice it
+    _, columns = basin_arrays(df, basin)
+    return group_stats(columns['Year'], columns['Season'], season_labels(df), columns[param], STATS)
+
+def cube_years(cube, y0, y1):
+    return cube[cube['Year'].between(y0, y1)].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, hash_funcs=FRAME_HASH)
+def scatter_figure(df, basin, y0, y1, param):
+    import plotly.graph_objects as go
+
+    # WebGL markers are drawn in the browser, so thousands of points cost the
+    # server only their JSON; the trend line is a least-squares fit
+    _, columns = basin_arrays(df, basin)
+    lo, hi = year_bounds(columns['Year'], y0, y1)
+    years, codes, values = columns['Year'][lo:hi], columns['Season'][lo:hi], columns[param][lo:hi]
+    fig = go.Figure()
+    for code, season in enumerate(season_labels(df)):
+        mask = codes == code
+        if mask.any():
+            fig.add_trace(go.Scattergl(x=years[mask], y=values[mask], mode='markers', name=str(season)))
+    point = ~np.isnan(values)
+    if np.unique(years[point]).size > 1:
+        x = years[point].astype(np.float64)
+        slope, intercept = np.polyfit(x, values[point].astype(np.float64), 1)
+        xs = np.array([x.min(), x.max()])
+        fig.add_trace(go.Scatter(x=xs, y=slope*xs + intercept, mode='lines', line=dict(color='red'), name='Trend'))
+    fig.update_layout(title=f"Scatter Plot of {param} for {basin}", xaxis_title="Year", yaxis_title=param, height=600)
+    return fig
+
+@st.cache_data(show_spinner=False, hash_funcs=FRAME_HASH)
+def render_plot(df, basin, y0, y1, param, viz_type):
+    # plotting libraries are imported on first use to keep them off the cold start
+    from matplotlib.figure import Figure
+
+    # rendered once per (basin, years, parameter, chart) and keyed on those
+    # scalars, so reruns reuse the cached PNG bytes without hashing any rows;
+    # plain matplotlib calls on the cube / basin arrays, with none of
+    # seaborn's per-call regrouping and estimator passes. A bare Figure
+    # renders with Agg and bypasses pyplot's global figure manager, which
+    # is not safe on Streamlit's per-session threads.
+    fig = Figure(figsize=(12,6))
+    ax = fig.subplots()
+    if viz_type in ("Bar Chart", "Line Graph"):
+        cube = cube_years(agg_cube(df, basin, param), y0, y1)
+        years, year_pos = np.unique(cube['Year'].to_numpy(), return_inverse=True)
+        present = set(cube['Season'])
+        seasons = [s for s in season_labels(df) if s in present]
+        width = 0.8 / max(len(seasons), 1)
+        for i, season in enumerate(seasons):
+            rows = (cube['Season'] == season).to_numpy()
+            mean = cube['mean'].to_numpy()[rows]
+            if viz_type == "Bar Chart":
+                offset = (i - (len(seasons) - 1) / 2) * width
+                ax.bar(year_pos[rows] + offset, mean, width=width, label=str(season))
+            else:
+                # yearly mean with a normal-approximation 95% band taken
+                # from the cube's std and count
+                x = years[year_pos[rows]]
+                half = 1.96 * cube['std'].to_numpy()[rows] / np.sqrt(cube['count'].to_numpy()[rows])
+                line, = ax.plot(x, mean, marker='o', label=str(season))
+                ax.fill_between(x, mean - half, mean + half, color=line.get_color(), alpha=0.2)
+        if viz_type == "Bar Chart":
+            ax.set_xticks(np.arange(len(years)), years)
+        ax.set_xlabel("Year")
+        if seasons:
+            ax.legend(title="Season")
+    elif viz_type == "Box Plot":
+        _, columns = basin_arrays(df, basin)
+        lo, hi = year_bounds(columns['Year'], y0, y1)
+        codes, values = columns['Season'][lo:hi], columns[param][lo:hi]
+        keep = ~np.isnan(values)
+        groups, names = [], []
+        for code, season in enumerate(season_labels(df)):
+            group = values[keep & (codes == code)]
+            if group.size:
+                groups.append(group)
+                names.append(str(season))
+        ax.boxplot(groups)
+        ax.set_xticks(np.arange(1, len(names) + 1), names)
+        ax.set_xlabel("Season")
+    ax.set_ylabel(param)
+
+    ax.set_title(f"{viz_type} of {param} for {basin}")
+    ax.tick_params(axis='x', labelrotation=90)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=90, bbox_inches='tight')
+    return buf.getvalue()
+
+def cov_to_corr(mat):
+    # scale a (co)variance / cross-product matrix to correlations in place;
+    # constant columns have zero variance and come out as NaN
+    d = np.sqrt(np.diag(mat))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mat /= np.outer(d, d)
+    return np.clip(mat, -1, 1, out=mat)
+
+def pearson_matrix(arr):
+    # centre once, then a single BLAS GEMM over the contiguous columns gives
+    # the whole symmetric cross-product matrix
+    x = arr - arr.mean(axis=0)
+    mat = x.T @ x
+    # an exactly constant column may keep rounding residue after centring;
+    # zero it so it comes out NaN, as in DataFrame.corr
+    flat = np.ptp(arr, axis=0) == 0
+    mat[flat, :] = 0
+    mat[:, flat] = 0
+    return cov_to_corr(mat)
+
+def complete_rows(df, basin, parameters):
+    # the basin's rows with every parameter present (what dropna() keeps),
+    # still in year order, as (years, float64 matrix)
+    _, columns = basin_arrays(df, basin)
+    x = np.column_stack([columns[p] for p in parameters]).astype(np.float64)
+    complete = ~np.isnan(x).any(axis=1)
+    return columns['Year'][complete], x[complete]
+
+@st.cache_resource(show_spinner=False, hash_funcs=FRAME_HASH, max_entries=16)
+def basin_moments(df, basin, parameters):
+    # per-year sufficient statistics of the basin's complete rows: row count,
+    # column sums and the cross-product matrix z.T @ z. Columns are first
+    # standardised over the whole basin so the later subtraction of the
+    # squared sums stays well conditioned.
+    years, x = complete_rows(df, basin, parameters)
+    if not len(x):
+        return years, np.zeros(0, np.intp), None, None
+    scale = x.std(axis=0)
+    z = (x - x.mean(axis=0)) / np.where(scale > 0, scale, 1.0)
+    uniq, starts = np.unique(years, return_index=True)
+    ends = np.r_[starts[1:], len(z)]
+    sums = np.add.reduceat(z, starts, axis=0)
+    cross = np.stack([z[a:b].T @ z[a:b] for a, b in zip(starts, ends)])
+    return uniq, ends - starts, sums, cross
+
+# the float64 matrix plus its int64 argsort cost 16 bytes per cell, so only
+# the most recently used basins are kept
+@st.cache_resource(show_spinner=False, hash_funcs=FRAME_HASH, max_entries=8)
+def basin_rank_order(df, basin, parameters):
+    # every parameter's argsort over the basin's complete rows, sorted once;
+    # the rows of a year range are a contiguous block, so filtering this
+    # order to the block gives the range's sort order without re-sorting
+    years, x = complete_rows(df, basin, parameters)
+    return years, x, np.argsort(x, axis=0, kind='stable')
+
+def range_ranks(x, order, lo, hi):
+    # Spearman ranks (ties averaged) of rows lo..hi-1, read off the basin order
+    n = hi - lo
+    ranks = np.empty((n, x.shape[1]))
+    for j in range(x.shape[1]):
+        idx = order[:, j]
+        idx = idx[(idx >= lo) & (idx < hi)]
+        v = x[idx, j]
+        new = np.r_[True, v[1:] != v[:-1]]
+        starts = np.flatnonzero(new)
+        ends = np.r_[starts[1:], n]
+        ranks[idx - lo, j] = ((starts + ends + 1) / 2)[np.cumsum(new) - 1]
+    return ranks
+
+@st.cache_data(show_spinner=False, hash_funcs=FRAME_HASH)
+def compute_corr(df, basin, y0, y1, parameters, method):
+    if method == "pearson":
+        # Pearson for any year range is a sum over the precomputed per-year
+        # moments: no pass over the rows, just a few P x P additions
+        years, counts, sums, cross = basin_moments(df, basin, parameters)
+        lo, hi = year_bounds(years, y0, y1)
+        n = counts[lo:hi].sum()
+        if n >= 2:
+            total = sums[lo:hi].sum(axis=0)
+            raw = cross[lo:hi].sum(axis=0)
+            cov = raw - np.outer(total, total) / n
+            # the subtraction cancels when a column barely varies within the
+            # range compared with its offset from the basin mean (a constant
+            # column, or a basin scale inflated by an outlier in another
+            # year); such ranges are recomputed from their rows below
+            if (np.diag(cov) > 1e-6 * np.diag(raw)).all():
+                labels = pd.Index(parameters)
+                return pd.DataFrame(cov_to_corr(cov), index=labels, columns=labels)
+
+    # Spearman (ranks taken from the cached basin order), an ill-conditioned
+    # Pearson range, or fewer than two complete rows (which pandas turns
+    # into its all-NaN matrix)
+    if method == "pearson":
+        years, x = complete_rows(df, basin, parameters)
+    else:
+        years, x, order = basin_rank_order(df, basin, parameters)
+    lo, hi = year_bounds(years, y0, y1)
+    if hi - lo < 2:
+        return pd.DataFrame(x[lo:hi], columns=list(parameters)).corr(method=method)
+    arr = x[lo:hi] if method == "pearson" else range_ranks(x, order, lo, hi)
+    labels = pd.Index(parameters)
+    return pd.DataFrame(pearson_matrix(arr), index=labels, columns=labels)
 
 # -----------------
 # Sidebar buttons
@@ -93,87 +555,88 @@ if help_clicked:
 - Columns: Basin, Date (YYYY-MM-DD), Season, Latitude, Longitude, numeric parameters
 """)
 
+# -----------------
+# Analysis panels
+# -----------------
+# Each panel is a fragment: changing one of its own widgets reruns only that
+# function, not the loading and sidebar selections around it. Fragments
+# cannot write to the sidebar, so a panel's widgets sit at its top.
+
+# -----------------
+# Descriptive Statistics
+# -----------------
+@st.fragment
+def desc_panel(df, basin, year_range, param):
+    st.subheader("Descriptive Statistics")
+    stat = st.multiselect("Select Statistics", STATS)
+    if stat:
+        results = cube_years(agg_cube(df, basin, param), *year_range)[['Year','Season', *stat]]
+        st.dataframe(results)
+
+# -----------------
+# Visualizations
+# -----------------
+@st.fragment
+def viz_panel(df, basin, year_range, param):
+    st.subheader("Visualizations")
+    viz_type = st.selectbox(
+        "Select Visualization",
+        ["Select Visualization","Bar Chart","Scatter Plot","Box Plot","Line Graph"]
+    )
+    if viz_type=="Scatter Plot":
+        st.plotly_chart(scatter_figure(df, basin, *year_range, param), width="stretch")
+    elif viz_type != "Select Visualization":
+        st.image(render_plot(df, basin, *year_range, param, viz_type), width="stretch")
+
+# -----------------
+# Correlation Analysis
+# -----------------
+# above the bundled dataset's 21 parameters, so its view keeps the values
+ANNOTATE_MAX = 30
+
+@st.fragment
+def corr_panel(df, basin, year_range, parameters):
+    st.subheader("Correlation Analysis")
+    corr_method = st.radio("Correlation Method", ["pearson","spearman"], horizontal=True)
+    corr = compute_corr(df, basin, *year_range, parameters, corr_method)
+    st.dataframe(corr)
+    import plotly.express as px
+
+    # drawn client-side: no per-cell Matplotlib text layout on the server.
+    # Cell labels grow as P^2 and are unreadable on wide uploads, so above
+    # ANNOTATE_MAX parameters the values are left to the hover tooltip.
+    text_auto = '.2f' if len(corr) <= ANNOTATE_MAX else False
+    fig = px.imshow(corr, color_continuous_scale='RdBu_r', zmin=-1, zmax=1, text_auto=text_auto, aspect='auto', height=700)
+    fig.update_layout(coloraxis_colorbar=dict(
+        tickvals=[-1,-0.5,0,0.5,1],
+        ticktext=['-1<br>Strong Negative','Weak (-0.5)','0<br>No Correlation','Weak (+0.5)','+1<br>Strong Positive']
+    ))
+    st.plotly_chart(fig, width="stretch")
+
 # -----------------
 # Step-by-step progressive selections
 # -----------------
 if menu != "Select an option":
-    basins = df['Basin'].dropna().unique()
-    basin = st.sidebar.selectbox("Select Basin", ["Select a Basin"] + list(basins))
+    basin = st.sidebar.selectbox("Select Basin", ["Select a Basin"] + list(schema["basins"]))
     if basin != "Select a Basin":
-        years = np.sort(df['Year'].dropna().astype(int))
         year_range = st.sidebar.slider(
             "Select Year Range",
-            min_value=int(years.min()),
-            max_value=int(years.max()),
-            value=(int(years.min()), int(years.max())),
+            min_value=schema["year_min"],
+            max_value=schema["year_max"],
+            value=(schema["year_min"], schema["year_max"]),
             step=1
         )
-        parameters = df.select_dtypes(include=[np.number]).columns.tolist()
-        exclude_cols = ['OBJECTID_12', 'Latitude', 'Longitude', 'Year']
-        parameters = [p for p in parameters if p not in exclude_cols]
-        param = st.sidebar.selectbox("Select Parameter", ["Select a Parameter"] + parameters)
+        param = st.sidebar.selectbox("Select Parameter", ["Select a Parameter"] + list(schema["parameters"]))
 
         if param != "Select a Parameter":
-            filtered = df[(df['Basin']==basin) & (df['Year']>=year_range[0]) & (df['Year']<=year_range[1])]
-            if filtered.empty:
+            if not year_slice(df, basin, *year_range).size:
                 st.warning("No data for selected basin/year.")
-            else:
-                # -----------------
-                # Descriptive Statistics
-                # -----------------
-                if menu == "Descriptive Statistics":
-                    stat = st.sidebar.multiselect(
-                        "Select Statistics",
-                        ["mean","median","min","max","std","count"]
-                    )
-                    if stat:
-                        st.subheader("Descriptive Statistics")
-                        results = filtered.groupby(['Year','Season'])[param].agg(stat).reset_index()
-                        st.dataframe(results)
-
-                # -----------------
-                # Visualizations
-                # -----------------
-                elif menu == "Visualizations":
-                    viz_type = st.sidebar.selectbox(
-                        "Select Visualization",
-                        ["Select Visualization","Bar Chart","Scatter Plot","Box Plot","Line Graph"]
-                    )
-                    if viz_type != "Select Visualization":
-                        st.subheader("Visualizations")
-                        filtered['Year'] = filtered['Year'].astype(int)
-                        plt.figure(figsize=(12,6))
-
-                        if viz_type=="Bar Chart":
-                            avg = filtered.groupby(['Year','Season'])[param].mean().reset_index()
-                            sns.barplot(x="Year", y=param, hue="Season", data=avg)
-                        elif viz_type=="Scatter Plot":
-                            sns.scatterplot(x="Year", y=param, hue="Season", data=filtered)
-                            sns.regplot(x="Year", y=param, data=filtered, scatter=False, color="red")
-                        elif viz_type=="Box Plot":
-                            sns.boxplot(x="Season", y=param, data=filtered)
-                        elif viz_type=="Line Graph":
-                            sns.lineplot(x="Year", y=param, hue="Season", marker="o", data=filtered)
-
-                        plt.title(f"{viz_type} of {param} for {basin}")
-                        plt.xticks(rotation=90)
-                        st.pyplot(plt)
-
-                # -----------------
-                # Correlation Analysis
-                # -----------------
-                elif menu == "Correlation Analysis":
-                    corr_method = st.sidebar.radio("Correlation Method", ["pearson","spearman"])
-                    corr_df = filtered[parameters].dropna()
-                    corr = corr_df.corr(method=corr_method)
-                    st.subheader("Correlation Analysis")
-                    st.dataframe(corr)
-                    plt.figure(figsize=(12,8))
-                    ax = sns.heatmap(corr, annot=True, cmap="coolwarm", vmin=-1,vmax=1)
-                    colorbar = ax.collections[0].colorbar
-                    colorbar.set_ticks([-1,-0.5,0,0.5,1])
-                    colorbar.set_ticklabels(['-1\nStrong Negative','Weak (-0.5)','0\nNo Correlation','Weak (+0.5)','+1\nStrong Positive'])
-                    st.pyplot(plt)
+            elif menu == "Descriptive Statistics":
+                desc_panel(df, basin, year_range, param)
+            elif menu == "Visualizations":
+                viz_panel(df, basin, year_range, param)
+            elif menu == "Correlation Analysis":
+                corr_panel(df, basin, year_range, schema["parameters"])
 
 # -----------------
 # Display Authors if sidebar clicked
@@ -194,8 +657,14 @@ if author_clicked:
 if upload_clicked:
     uploaded_file = st.file_uploader("Upload your own CSV/Excel (optional)", type=["csv","xls","xlsx"])
     if uploaded_file:
-        df = load_data(uploaded_file)
-        st.success("Your data is loaded! You can now use the selections above.")
+        try:
+            df, schema = load_data(uploaded_file)
+        except UPLOAD_ERRORS as e:
+            st.error(f"Could not read the uploaded file: {e}")
+        else:
+            st.success("Your data is loaded! You can now use the selections above.")
+            if schema["dropped_rows"]:
+                st.warning(f"{schema['dropped_rows']} rows without a readable Date were left out.")
 
 
 